@@ -1,21 +1,21 @@
 """Utilities to interpret the pipeline poller obset information and generate product filenames
 
 The function, interpret_obset_input, parses the file generated by the pipeline
-poller, and produces a tree listing of the output products.  The function,
-parse_obset_tree, converts the tree into product catagories.
+poller, and produces a listing of the output products sorted into product
+catagories.
 
 """
+import csv
 import os
 import sys
-from collections import OrderedDict
-import numpy as np
+from collections import namedtuple
+from collections.abc import Mapping
+from functools import lru_cache
 
 from stsci.tools import logutil
 
 
 from astropy.io import fits
-from astropy.io import ascii
-from astropy.table import Table, Column
 from drizzlepac.hlautils.product import ExposureProduct, FilterProduct, TotalProduct
 from . import analyze
 from . import astroquery_utils as aqutils
@@ -28,9 +28,46 @@ TDP_STR = 'total detection product {:02d}'
 
 # Define the mapping between the first character of the filename and the associated instrument
 INSTRUMENT_DICT = {'i': 'WFC3', 'j': 'ACS', 'o': 'STIS', 'u': 'WFPC2', 'x': 'FOC', 'w': 'WFPC'}
+# Length of the ipppssoot rootname of a standard HST filename (e.g., ib4606c5q_flc.fits)
+IPPPSSOOT_LEN = 9
+
 POLLER_COLNAMES = ['filename', 'proposal_id', 'program_id', 'obset_id',
                    'exptime', 'filters', 'detector', 'pathname']
 
+# A single row of the poller file, plus the instrument derived from the filename
+PollerRow = namedtuple('PollerRow', POLLER_COLNAMES + ['instrument'])
+
+
+class ProductInfo(Mapping):
+    """Information string and input filenames for one entry of the obset products dict.
+
+    Entries are accessed as attributes, e.g. ``obset_dict[key].files``.  They are also
+    read-only mappings over the 'info' and 'files' keys, so ``obset_dict[key]['files']``
+    and iteration can be used to read them.  They are not dicts, however: item assignment
+    raises a TypeError, ``isinstance(entry, dict)`` is False, and the obset dict cannot be
+    passed directly to ``json.dumps``.
+    """
+    __slots__ = ('info', 'files')
+
+    def __init__(self, info, files):
+        self.info = info
+        self.files = files
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return "{}(info={!r}, files={!r})".format(self.__class__.__name__, self.info, self.files)
+
+
 __taskname__ = 'poller_utils'
 
 MSG_DATEFMT = '%Y%j%H%M%S'
@@ -64,7 +101,8 @@ def interpret_obset_input(results, log_level):
         filename, proposal_id, program_id, obset_id, exptime, filters, detector, pathname
 
     Output dict will have format (as needed by further code for creating the
-        product filenames) of:
+        product filenames) of the following, where each value is a `ProductInfo`
+        with `info` and `files` attributes that can also be indexed like a dict:
 
         obs_info_dict["single exposure product 00": {"info": '11665 06 wfc3 uvis ib4606c5q f555w drc',
                                                      "files": ['ib4606c5q_flc.fits']}
@@ -96,82 +134,22 @@ def interpret_obset_input(results, log_level):
     log.setLevel(log_level)
 
     log.debug("Interpret the poller file for the observation set.")
-    obset_table = build_poller_table(results, log_level)
-    # Add INSTRUMENT column
-    instr = INSTRUMENT_DICT[obset_table['filename'][0][0]]
-    # convert input to an Astropy Table for parsing
-    obset_table.add_column(Column([instr] * len(obset_table)), name='instrument')
-    # parse Table into a tree-like dict
-    log.debug("Build the observation set tree.")
-    obset_tree = build_obset_tree(obset_table)
+    obset_rows = build_poller_table(results, log_level)
     # Now create the output product objects
-    log.debug("Parse the observation set tree and create the exposure, filter, and total detection objects.")
-    obset_dict, tdp_list = parse_obset_tree(obset_tree, log_level)
-
-    # This little bit of code adds an attribute to single exposure objects that is True if a given filter only contains
-    # one input (e.g. n_exp = 1)
-    for tot_obj in tdp_list:
-        for filt_obj in tot_obj.fdp_list:
-            if len(filt_obj.edp_list) == 1:
-                is_singleton = True
-            else:
-                is_singleton = False
-            for edp_obj in filt_obj.edp_list:
-                edp_obj.is_singleton = is_singleton
+    log.debug("Parse the observation set rows and create the exposure, filter, and total detection objects.")
+    obset_dict, tdp_list = _build_products(obset_rows, log_level)
 
     return obset_dict, tdp_list
 
 
 # Translate the database query on an obset into actionable lists of filenames
-def build_obset_tree(obset_table):
-    """Convert obset table into a tree listing all products to be created."""
+def _build_products(obset_rows, log_level):
+    """Convert obset rows into products
 
-    # Each product will consist of the appropriate string as the key and
-    # a dict of 'info' and 'files' information
-
-    # Start interpreting the obset table
-    obset_tree = {}
-    for row in obset_table:
-        # Get some basic information from the first row - no need to check
-        # for multiple instruments as data from different instruments will
-        # not be combined.
-        det = row['detector']
-        orig_filt = row['filters']
-        # Potentially need to manipulate the 'filters' string for instruments
-        # with two filter wheels
-        filt = determine_filter_name(orig_filt)
-        row['filters'] = filt
-        row_info, filename = create_row_info(row)
-        # Initial population of the obset tree for this detector
-        if det not in obset_tree:
-            obset_tree[det] = {}
-            obset_tree[det][filt] = [(row_info, filename)]
-        else:
-            det_node = obset_tree[det]
-            if filt not in det_node:
-                det_node[filt] = [(row_info, filename)]
-            else:
-                det_node[filt].append((row_info, filename))
-
-    return obset_tree
-
-
-def create_row_info(row):
-    """Build info string for a row from the obset table"""
-    info_list = [str(row['proposal_id']), "{}".format(row['obset_id']), row['instrument'],
-                 row['detector'], row['filename'][:row['filename'].find('_')], row['filters']]
-    return ' '.join(map(str.upper, info_list)), row['filename']
-
-
-def parse_obset_tree(det_tree, log_level):
-    """Convert tree into products
-
-    Tree generated by `create_row_info()` will always have the following
-    levels:
-          * detector
-              * filters
-                  * exposure
-    Each exposure will have an entry dict with keys 'info' and 'filename'.
+    The rows are visited once to derive the filter name, filetype and information
+    string of every exposure, and to group the exposures by detector and filter.
+    The products are then created from those groups in detector, filter, exposure
+    order, without building and re-parsing an intermediate tree of the rows.
 
     Products created will be:
       * total detection product per detector
@@ -180,79 +158,109 @@ def parse_obset_tree(det_tree, log_level):
     """
     log.setLevel(log_level)
 
+    # Map each detector to its filetype and lowercase name, and to the exposure lists of
+    # its filters, in the order they are first encountered.  The exposure lists are found
+    # through a flat dict keyed on the (detector, filter) pair, so each row costs one
+    # lookup per level.
+    det_entries = {}
+    det_filter_groups = {}
+    det_filt_exposures = {}
+
+    for row in obset_rows:
+        # Get some basic information from the row - no need to check
+        # for multiple instruments as data from different instruments will
+        # not be combined.
+        det = row.detector
+        # Potentially need to manipulate the 'filters' string for instruments
+        # with two filter wheels
+        filt = determine_filter_name(row.filters)
+        filename = row.filename
+
+        # Determine if the individual files being processed are flt or flc from the first
+        # exposure of each detector and set the filetype accordingly (flt->drz or flc->drc).
+        # The lowercase detector name is shared by all the exposures of the detector too.
+        det_entry = det_entries.get(det)
+        if det_entry is None:
+            det_entry = ("drz" if filename[10:13].lower() == "flt" else "drc", det.lower())
+            det_entries[det] = det_entry
+            det_filter_groups[det] = []
+        filetype, detector = det_entry
+
+        # Generate the full product dictionary information string:
+        # proposal_id, obset_id, instrument, detector, ipppssoot, filter, and filetype
+        # The components are kept for every product object.  Only those which can contain
+        # letters need lowercasing; the filter name and filetype already are lowercase.
+        # Standard filenames have a 9 character ipppssoot, so only search for the
+        # end of the rootname when the filename does not follow that format
+        ipppssoot_len = IPPPSSOOT_LEN
+        if filename[ipppssoot_len:ipppssoot_len + 1] != '_':
+            ipppssoot_len = filename.find('_')
+        prod_parts = [str(row.proposal_id), row.obset_id.lower(), row.instrument.lower(),
+                      detector, filename[:ipppssoot_len].lower(), filt, filetype]
+        prod_info = " ".join(prod_parts)
+
+        fp_key = (det, filt)
+        exposures = det_filt_exposures.get(fp_key)
+        if exposures is None:
+            exposures = []
+            det_filt_exposures[fp_key] = exposures
+            det_filter_groups[det].append(exposures)
+        exposures.append((prod_info, prod_parts, filename))
+
     # Initialize products dict
     obset_products = {}
+    tdp_list = []
 
-    # For each level, define a product, starting with the detector used...
-    prev_det_indx = 0
-    det_indx = 0
     filt_indx = 0
     sep_indx = 0
 
-    tdp_list = []
-
-    # Determine if the individual files being processed are flt or flc and
-    # set the filetype accordingly (flt->drz or flc->drc).
-    filetype = ''
     # Setup products for each detector used
-    for filt_tree in det_tree.values():
+    for det_indx, filter_groups in enumerate(det_filter_groups.values()):
+        # Set up the total detection product dictionary from its first exposure and
+        # create a total detection product object for this instrument/detector
         totprod = TDP_STR.format(det_indx)
-        obset_products[totprod] = {'info': "", 'files': []}
-        det_indx += 1
+        tdp_info, tdp_parts, _ = filter_groups[0][0]
+        obset_products[totprod] = ProductInfo(tdp_info, [])
+        prop_id, obset_id, instrument, detector, ipppssoot, _, filetype = tdp_parts
+        tdp_obj = TotalProduct(prop_id, obset_id, instrument, detector,
+                               ipppssoot, filetype, log_level)
+
         # Find all filters used...
-        for filter_files in filt_tree.values():
+        for exposures in filter_groups:
             # Use this to create and populate filter product dictionary entry
             fprod = FP_STR.format(filt_indx)
-            obset_products[fprod] = {'info': "", 'files': []}
             filt_indx += 1
-            # Populate single exposure dictionary entry now as well
-            for filename in filter_files:
-                # Parse the first filename[1] to determine if the products are flt or flc
-                if det_indx != prev_det_indx:
-                    filetype = "drc"
-                    if filename[1][10:13].lower().endswith("flt"):
-                        filetype = "drz"
-                    prev_det_indx = det_indx
-
-                # Generate the full product dictionary information string:
-                # proposal_id, obset_id, instrument, detector, ipppssoot, filter, and filetype
-                prod_info = (filename[0] + " " + filetype).lower()
+            fp_info, fp_parts, _ = exposures[0]
+            obset_products[fprod] = ProductInfo(fp_info, [])
+            prop_id, obset_id, instrument, detector, ipppssoot, filters, filetype = fp_parts
+            # Create a filter product object for this instrument/detector
+            filt_obj = FilterProduct(prop_id, obset_id, instrument, detector,
+                                     ipppssoot, filters, filetype, log_level)
+            # Single exposure objects are flagged as singletons if their filter only
+            # contains one input (e.g. n_exp = 1)
+            is_singleton = len(exposures) == 1
 
+            # Populate single exposure dictionary entry now as well
+            for prod_info, prod_parts, filename in exposures:
                 # Set up the single exposure product dictionary
                 sep = SEP_STR.format(sep_indx)
-                obset_products[sep] = {'info': prod_info,
-                                       'files': [filename[1]]}
+                obset_products[sep] = ProductInfo(prod_info, [filename])
 
                 # Create a single exposure product object
-                prod_list = prod_info.split(" ")
-                sep_obj = ExposureProduct(prod_list[0], prod_list[1], prod_list[2], prod_list[3],
-                                          filename[1], prod_list[5], prod_list[6], log_level)
-                # Set up the filter product dictionary and create a filter product object
-                # Initialize `info` key for this filter product dictionary
-                if not obset_products[fprod]['info']:
-                    obset_products[fprod]['info'] = prod_info
-
-                    # Create a filter product object for this instrument/detector
-                    filt_obj = FilterProduct(prod_list[0], prod_list[1], prod_list[2], prod_list[3],
-                                             prod_list[4], prod_list[5], prod_list[6], log_level)
+                prop_id, obset_id, instrument, detector, _, filters, filetype = prod_parts
+                sep_obj = ExposureProduct(prop_id, obset_id, instrument, detector,
+                                          filename, filters, filetype, log_level)
+                sep_obj.is_singleton = is_singleton
+
                 # Append exposure object to the list of exposure objects for this specific filter product object
                 filt_obj.add_member(sep_obj)
                 # Populate filter product dictionary with input filename
-                obset_products[fprod]['files'].append(filename[1])
-
-                # Set up the total detection product dictionary and create a total detection product object
-                # Initialize `info` key for total detection product
-                if not obset_products[totprod]['info']:
-                    obset_products[totprod]['info'] = prod_info
-
-                    # Create a total detection product object for this instrument/detector
-                    tdp_obj = TotalProduct(prod_list[0], prod_list[1], prod_list[2], prod_list[3],
-                                           prod_list[4], prod_list[6], log_level)
+                obset_products[fprod].files.append(filename)
 
                 # Append exposure object to the list of exposure objects for this specific total detection product
                 tdp_obj.add_member(sep_obj)
                 # Populate total detection product dictionary with input filename
-                obset_products[totprod]['files'].append(filename[1])
+                obset_products[totprod].files.append(filename)
 
                 # Increment single exposure index
                 sep_indx += 1
@@ -269,9 +277,11 @@ def parse_obset_tree(det_tree, log_level):
     # Done... return dict and object product list
     return obset_products, tdp_list
 
+
 # ----------------------------------------------------------------------------------------------------------
 
 
+@lru_cache(maxsize=256)
 def determine_filter_name(raw_filter):
     """
     Generate the final filter name to be used for an observation.
@@ -296,17 +306,23 @@ def determine_filter_name(raw_filter):
       name second (e.g., 'f606w-pol60').
     - NOTE: There should always be at least one filter name provided to
       this routine or this input is invalid.
+
+    Results are cached, as a visit only uses a handful of distinct filter strings.
     """
 
     raw_filter = raw_filter.lower()
 
+    # Most exposures only report a single filter name, so there is nothing to combine
+    if ';' not in raw_filter:
+        return 'clear' if raw_filter.startswith('clear') else raw_filter
+
     # There might be two filters, so split the filter names into a list
     filter_list = raw_filter.split(';')
     output_filter_list = []
 
     for filt in filter_list:
         # Get the names of the non-clear filters
-        if 'clear' not in filt:
+        if not filt.startswith('clear'):
             output_filter_list.append(filt)
 
     if not output_filter_list:
@@ -333,30 +349,35 @@ def build_poller_table(input, log_level):
 
     Returns
     --------
-    poller_table : Table
-        Astropy table object with the same columns as a poller file.
+    poller_rows : list
+        List of `PollerRow` namedtuples with the same columns as a poller file, plus the
+        instrument derived from the first character of the filenames.
 
     """
     log.setLevel(log_level)
 
     datasets = []
     is_poller_file = False
-    obs_converters = {'col4': [ascii.convert_numpy(np.str)]}
     if isinstance(input, str):
-        input_table = ascii.read(input, format='no_header', converters=obs_converters)
-        if len(input_table.columns) == len(POLLER_COLNAMES):
+        # Read the lines straight into a dict keyed on the filename so only one
+        # copy of the file contents is held while the datasets are analyzed
+        input_rows = {}
+        with open(input, newline='') as poller_file:
+            for cols in csv.reader(poller_file):
+                # Skip blank, whitespace-only and '#' comment lines
+                cols = [col.strip() for col in cols]
+                if not cols or not cols[0] or cols[0].startswith('#'):
+                    continue
+                input_rows[cols[0]] = cols
+        if input_rows and len(next(iter(input_rows.values()))) == len(POLLER_COLNAMES):
             # We were provided a poller file
-            # Now assign column names to table
-            for i, colname in enumerate(POLLER_COLNAMES):
-                input_table.columns[i].name = colname
-
-            # Convert to a string column, instead of int64
-            input_table['obset_id'] = input_table['obset_id'].astype(np.str)
-
-        # Since a poller file was the input, it is assumed all the input
-        # data is in the locale directory so just collect the filenames.
-        datasets = input_table[input_table.colnames[0]].tolist()
-        is_poller_file = True
+            # Since a poller file was the input, it is assumed all the input
+            # data is in the locale directory so just collect the filenames.
+            datasets = list(input_rows)
+            is_poller_file = True
+        else:
+            # We were provided a file listing the dataset names
+            filenames = list(input_rows)
     elif isinstance(input, list):
         filenames = input
 
@@ -385,50 +406,40 @@ def build_poller_table(input, log_level):
 
     # Each image, whether from a poller file or from an input list needs to be
     # analyzed to ensure it is viable for drizzle processing.  If the image is not
-    # viable, it should not be included in the output "poller" table.
+    # viable, it should not be included in the output "poller" rows.
     usable_datasets = analyze.analyze_wrapper(datasets)
     if not usable_datasets:
         log.warning("No usable images in poller file or input list for drizzling. The processing of this data is ending.")
         sys.exit(0)
 
-    cols = OrderedDict()
-    for cname in POLLER_COLNAMES:
-        cols[cname] = []
-    cols['filename'] = usable_datasets
+    # Data from different instruments will not be combined, so the instrument only
+    # needs to be determined once from the first character of a filename
+    instrument = INSTRUMENT_DICT.get(usable_datasets[0][0])
+    if instrument is None:
+        id = '[poller_utils.build_poller_table] '
+        log.error("{}: Unable to determine the instrument of {}.".format(id, usable_datasets[0]))
+        raise ValueError
 
+    poller_rows = []
+    # The input was a poller file, so just keep the viable data rows for output
+    if is_poller_file:
+        for d in usable_datasets:
+            filename, proposal_id, program_id, obset_id, exptime, filters, detector, pathname = input_rows[d]
+            poller_rows.append(PollerRow(filename, int(proposal_id), program_id, obset_id, float(exptime),
+                                         filters, detector, pathname, instrument))
     # If processing a list of files, evaluate each input dataset for the information needed
     # for the poller file
-    if not is_poller_file:
+    else:
         for d in usable_datasets:
             with fits.open(d) as dhdu:
                 hdr = dhdu[0].header
-                cols['program_id'].append(d[1:4].upper())
-                cols['obset_id'].append(str(d[4:6]))
-                cols['proposal_id'].append(hdr['proposid'])
-                cols['exptime'].append(hdr['exptime'])
-                cols['detector'].append(hdr['detector'])
-                cols['pathname'].append(os.path.abspath(d))
                 # process filter names
                 if d[0] == 'j':  # ACS data
                     filters = processing_utils.get_acs_filters(dhdu, all=True)
                 elif d[0] == 'i':
                     filters = dhdu['filter']
-                cols['filters'].append(filters)
-
-        # Build output table
-        poller_data = [col for col in cols.values()]
-        poller_table = Table(data=poller_data)
-
-        # Now assign column names to obset_table
-        for i, colname in enumerate(POLLER_COLNAMES):
-            poller_table.columns[i].name = colname
-    # The input was a poller file, so just keep the viable data rows for output
-    else:
-        good_rows = []
-        for d in usable_datasets:
-            for i, old_row in enumerate(input_table):
-                if d == input_table['filename'][i]:
-                    good_rows.append(old_row)
-            poller_table = Table(rows=good_rows, names=input_table.colnames)
+                poller_rows.append(PollerRow(d, hdr['proposid'], d[1:4].upper(), str(d[4:6]),
+                                             hdr['exptime'], filters, hdr['detector'],
+                                             os.path.abspath(d), instrument))
 
-    return poller_table
+    return poller_rows
@@ -39,7 +39,7 @@ class HAPProduct:
         self.detector = detector
         self.filetype = filetype
 
-        self.basename = "hst_" + "_".join(map(str, [prop_id, obset_id, instrument, detector])) + "_"
+        self.basename = "hst_{}_{}_{}_{}_".format(prop_id, obset_id, instrument, detector)
 
         # exposure_name is the ipppssoo or a portion thereof
         self.exposure_name = filename[0:8]
@@ -172,7 +172,7 @@ class FilterProduct(HAPProduct):
         self.exposure_name = filename[0:6]
         self.filters = filters
 
-        self.product_basename = self.basename + "_".join(map(str, [filters, self.exposure_name]))
+        self.product_basename = "{}{}_{}".format(self.basename, filters, self.exposure_name)
         # Trailer names .txt or .log
         self.trl_logname = self.product_basename + "_trl.log"
         self.trl_filename = self.product_basename + "_trl.txt"
@@ -295,7 +295,7 @@ class ExposureProduct(HAPProduct):
         self.exptime = hdu_list[0].header['EXPTIME']
         hdu_list.close()
 
-        self.product_basename = self.basename + "_".join(map(str, [filters, self.exposure_name]))
+        self.product_basename = "{}{}_{}".format(self.basename, filters, self.exposure_name)
         self.drizzle_filename = self.product_basename + "_" + self.filetype + ".fits"
         self.headerlet_filename = self.product_basename + "_hlet.fits"
         self.trl_logname = self.product_basename + "_trl.log"
@@ -0,0 +1,159 @@
+""" Unit tests for the interpretation of pipeline poller files by poller_utils.
+
+    The product classes read FITS headers when they are created, and the dataset
+    analysis needs the actual exposures, so both are replaced by simple stand-ins.
+"""
+import pytest
+
+from stsci.tools import logutil
+
+from drizzlepac.hlautils import poller_utils
+
+# UVIS and IR exposures are interleaved on purpose, as the products must still be
+# grouped by detector and then filter in order of first appearance.
+POLLER_LINES = [
+    "ib4606c5q_flc.fits,11665,B46,06,1.0,F555W,UVIS,/ifs/archive/ib4606c5q_flc.fits",
+    "ib4606clq_flt.fits,11665,B46,06,1.0,F110W,IR,/ifs/archive/ib4606clq_flt.fits",
+    "ib4606c6q_flc.fits,11665,B46,06,1.0,F814W,UVIS,/ifs/archive/ib4606c6q_flc.fits",
+    "ib4606cmq_flt.fits,11665,B46,06,1.0,F110W,IR,/ifs/archive/ib4606cmq_flt.fits",
+    "ib4606cxq_flc.fits,11665,B46,06,1.0,F814W,UVIS,/ifs/archive/ib4606cxq_flc.fits",
+    "ib4606c7q_flc.fits,11665,B46,06,1.0,F555W,UVIS,/ifs/archive/ib4606c7q_flc.fits",
+    "ib4606crq_flt.fits,11665,B46,06,1.0,F160W,IR,/ifs/archive/ib4606crq_flt.fits",
+]
+
+# Dataset rejected by the (mocked) analysis of the exposures
+UNUSABLE_DATASET = "ib4606cxq_flc.fits"
+
+UVIS_F555W_INFO = "11665 06 wfc3 uvis ib4606c5q f555w drc"
+IR_F110W_INFO = "11665 06 wfc3 ir ib4606clq f110w drz"
+
+EXPECTED_PRODUCTS = [
+    ("total detection product 00", UVIS_F555W_INFO,
+     ["ib4606c5q_flc.fits", "ib4606c7q_flc.fits", "ib4606c6q_flc.fits"]),
+    ("filter product 00", UVIS_F555W_INFO, ["ib4606c5q_flc.fits", "ib4606c7q_flc.fits"]),
+    ("single exposure product 00", UVIS_F555W_INFO, ["ib4606c5q_flc.fits"]),
+    ("single exposure product 01", "11665 06 wfc3 uvis ib4606c7q f555w drc", ["ib4606c7q_flc.fits"]),
+    ("filter product 01", "11665 06 wfc3 uvis ib4606c6q f814w drc", ["ib4606c6q_flc.fits"]),
+    ("single exposure product 02", "11665 06 wfc3 uvis ib4606c6q f814w drc", ["ib4606c6q_flc.fits"]),
+    ("total detection product 01", IR_F110W_INFO,
+     ["ib4606clq_flt.fits", "ib4606cmq_flt.fits", "ib4606crq_flt.fits"]),
+    ("filter product 02", IR_F110W_INFO, ["ib4606clq_flt.fits", "ib4606cmq_flt.fits"]),
+    ("single exposure product 03", IR_F110W_INFO, ["ib4606clq_flt.fits"]),
+    ("single exposure product 04", "11665 06 wfc3 ir ib4606cmq f110w drz", ["ib4606cmq_flt.fits"]),
+    ("filter product 03", "11665 06 wfc3 ir ib4606crq f160w drz", ["ib4606crq_flt.fits"]),
+    ("single exposure product 05", "11665 06 wfc3 ir ib4606crq f160w drz", ["ib4606crq_flt.fits"]),
+]
+
+
+class MockTotalProduct:
+    def __init__(self, prop_id, obset_id, instrument, detector, filename, filetype, log_level):
+        self.instrument = instrument
+        self.detector = detector
+        self.filetype = filetype
+        self.edp_list = []
+        self.fdp_list = []
+
+    def add_member(self, edp):
+        self.edp_list.append(edp)
+
+    def add_product(self, fdp):
+        self.fdp_list.append(fdp)
+
+
+class MockFilterProduct:
+    def __init__(self, prop_id, obset_id, instrument, detector, filename, filters, filetype, log_level):
+        self.filters = filters
+        self.filetype = filetype
+        self.edp_list = []
+
+    def add_member(self, edp):
+        self.edp_list.append(edp)
+
+
+class MockExposureProduct:
+    def __init__(self, prop_id, obset_id, instrument, detector, filename, filters, filetype, log_level):
+        self.full_filename = filename
+        self.filters = filters
+        self.is_singleton = False
+
+
+@pytest.fixture
+def poller_file(tmpdir, monkeypatch):
+    """Write a small poller file and replace the dataset analysis and product classes."""
+    filename = tmpdir.join("ib4606.out")
+    filename.write("\n".join(POLLER_LINES) + "\n")
+
+    monkeypatch.setattr(poller_utils.analyze, "analyze_wrapper",
+                        lambda datasets: [d for d in datasets if d != UNUSABLE_DATASET])
+    monkeypatch.setattr(poller_utils, "TotalProduct", MockTotalProduct)
+    monkeypatch.setattr(poller_utils, "FilterProduct", MockFilterProduct)
+    monkeypatch.setattr(poller_utils, "ExposureProduct", MockExposureProduct)
+
+    return str(filename)
+
+
+def test_obset_dict_products(poller_file):
+    """Products are numbered by detector, filter, then exposure in order of first appearance."""
+    obset_dict, _ = poller_utils.interpret_obset_input(poller_file, logutil.logging.INFO)
+
+    assert list(obset_dict) == [key for key, _, _ in EXPECTED_PRODUCTS]
+    for key, info, files in EXPECTED_PRODUCTS:
+        assert obset_dict[key]["info"] == info
+        assert obset_dict[key]["files"] == files
+        assert dict(obset_dict[key]) == {"info": info, "files": files}
+
+
+def test_product_objects(poller_file):
+    """The product objects are grouped and ordered the same way as the obset dict."""
+    _, tdp_list = poller_utils.interpret_obset_input(poller_file, logutil.logging.INFO)
+
+    assert [(tdp.detector, tdp.filetype) for tdp in tdp_list] == [("uvis", "drc"), ("ir", "drz")]
+    assert [[fdp.filters for fdp in tdp.fdp_list] for tdp in tdp_list] == [["f555w", "f814w"],
+                                                                           ["f110w", "f160w"]]
+    assert [edp.full_filename for edp in tdp_list[0].edp_list] == ["ib4606c5q_flc.fits",
+                                                                   "ib4606c7q_flc.fits",
+                                                                   "ib4606c6q_flc.fits"]
+    assert [edp.full_filename for edp in tdp_list[1].edp_list] == ["ib4606clq_flt.fits",
+                                                                   "ib4606cmq_flt.fits",
+                                                                   "ib4606crq_flt.fits"]
+
+
+def test_singleton_exposures(poller_file):
+    """Only exposures which are alone in their filter are flagged as singletons."""
+    _, tdp_list = poller_utils.interpret_obset_input(poller_file, logutil.logging.INFO)
+
+    singletons = {edp.full_filename: edp.is_singleton for tdp in tdp_list for edp in tdp.edp_list}
+    assert singletons == {"ib4606c5q_flc.fits": False,
+                          "ib4606c7q_flc.fits": False,
+                          "ib4606c6q_flc.fits": True,
+                          "ib4606clq_flt.fits": False,
+                          "ib4606cmq_flt.fits": False,
+                          "ib4606crq_flt.fits": True}
+
+
+def test_blank_lines_ignored(poller_file):
+    """Blank, whitespace-only and comment lines in a poller file do not become datasets."""
+    lines = (["# filename,proposal_id,program_id,obset_id,exptime,filters,detector,pathname"] +
+             POLLER_LINES[:3] + ["", "   ", "\t", "  # dropped exposure"] + POLLER_LINES[3:])
+    with open(poller_file, "w") as pfile:
+        pfile.write("\n".join(lines) + "\n")
+
+    obset_dict, _ = poller_utils.interpret_obset_input(poller_file, logutil.logging.INFO)
+
+    assert list(obset_dict) == [key for key, _, _ in EXPECTED_PRODUCTS]
+    for key, info, files in EXPECTED_PRODUCTS:
+        assert obset_dict[key]["files"] == files
+
+
+@pytest.mark.parametrize("raw_filter, filter_name",
+                         [("F555W", "f555w"),
+                          ("CLEAR1L", "clear"),
+                          ("CLEAR1L;F555W", "f555w"),
+                          ("F555W;CLEAR2L", "f555w"),
+                          ("CLEAR1L;CLEAR2L", "clear"),
+                          ("POL60V;F606W", "f606w-pol60v"),
+                          ("F555W;XCLEAR", "f555w-xclear"),
+                          ("XCLEAR", "xclear")])
+def test_determine_filter_name(raw_filter, filter_name):
+    """Only the names which start with "clear" are dropped, and polarizers go last."""
+    assert poller_utils.determine_filter_name(raw_filter) == filter_name